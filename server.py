@@ -1,88 +1,246 @@
 #!/usr/bin/env python3
 """MCP server that reads OpenClaw session files locally for usage/cost data."""
 
+import bisect
+import heapq
 import json
+import mmap
 import os
+import re
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 
 from mcp.server.fastmcp import FastMCP
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Line decoder for session files; both accept bytes.
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+_PRETTY_JSON = os.environ.get("OPENCLAW_PRETTY_JSON", "") == "1"
+
+
+def _round_floats(obj):
+    """Return a copy of a result tree with every float rounded to 6 places.
+
+    Cost quantization happens here, in one pass right before serialization,
+    instead of piecemeal round() calls inside every aggregation builder.
+    """
+    t = type(obj)
+    if t is float:
+        return round(obj, 6)
+    if t is list:
+        return [_round_floats(v) for v in obj]
+    if t is dict or isinstance(obj, dict):
+        return {k: _round_floats(v) for k, v in obj.items()}
+    return obj
+
+
+def _dumps(data, round_floats: bool = False) -> str:
+    """Serialize a tool result to JSON, using orjson when available.
+
+    Output is compact by default — MCP clients don't need whitespace and
+    pretty-printing roughly doubles payload size. Set OPENCLAW_PRETTY_JSON=1
+    to indent for human inspection.
+    """
+    if round_floats:
+        data = _round_floats(data)
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if _PRETTY_JSON else 0
+        return orjson.dumps(data, option=option).decode()
+    if _PRETTY_JSON:
+        return json.dumps(data, indent=2)
+    return json.dumps(data, separators=(",", ":"))
+
+
 # ---------------------------------------------------------------------------
 # Session scanner — reads JSONL session files directly
 # ---------------------------------------------------------------------------
 
 AGENTS_DIR = Path(os.environ.get("OPENCLAW_AGENTS_DIR", Path.home() / ".openclaw" / "agents"))
 
+# Token/cost categories reported per assistant message.
+_TOKEN_KEYS = ("input", "output", "cacheRead", "cacheWrite")
+_LOG_TOKEN_KEYS = _TOKEN_KEYS + ("totalTokens",)
+_TOKEN_IDX = {key: i for i, key in enumerate(_TOKEN_KEYS)}
+
+
+def _bucket_row() -> list:
+    """Flat per-model bucket accumulator: 4 token counts, 4 cost sums, total cost."""
+    return [0, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
 
-def _session_files(agents_dir: Path) -> list[Path]:
-    """Find all session JSONL files (active and archived/reset)."""
-    files = []
-    for sessions_dir in agents_dir.glob("*/sessions"):
-        for f in sessions_dir.iterdir():
-            if f.name.endswith(".jsonl") or ".jsonl.reset." in f.name:
-                files.append(f)
+def _session_files(agents_dir: Path) -> list[tuple[Path, os.stat_result]]:
+    """Find all session JSONL files (active and archived/reset) with stats.
+
+    Uses os.scandir instead of glob/iterdir so each file is stat'ed at most
+    once here, and the result is handed to callers rather than re-fetched.
+    """
+    files: list[tuple[Path, os.stat_result]] = []
+    try:
+        agent_entries = list(os.scandir(agents_dir))
+    except OSError:
+        return files
+    for agent in agent_entries:
+        if not agent.is_dir():
+            continue
+        try:
+            session_entries = os.scandir(os.path.join(agent.path, "sessions"))
+        except OSError:
+            continue
+        with session_entries:
+            for entry in session_entries:
+                if entry.name.endswith(".jsonl") or ".jsonl.reset." in entry.name:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((Path(entry.path), st))
     return files
 
 
+# Reset date embedded in archived filenames, e.g. abc.jsonl.reset.2026-08-27T00-00-00
+_RESET_DATE_RE = re.compile(r"\.jsonl\.reset\.(\d{4})-(\d{2})-(\d{2})")
+
+
+def _strip_session_suffix(name: str) -> str:
+    """Strip the .jsonl / .jsonl.reset.* suffix from a session filename."""
+    idx = name.find(".jsonl")
+    return name[:idx] if idx >= 0 else name
+
+
 def _parse_session_key(path: Path) -> str:
     """Derive a session key from the file path.
 
     Format: agent:<agent_id>:<session_uuid>
     For archived files like abc.jsonl.reset.2026-..., strip the .reset.* suffix.
     """
-    agent_id = path.parent.parent.name
-    name = path.name
-    # Strip .reset.* suffix for archived files
-    idx = name.find(".jsonl.reset.")
-    if idx >= 0:
-        session_id = name[:idx]
-    elif name.endswith(".jsonl"):
-        session_id = name[:-6]
-    else:
-        session_id = name
-    return f"agent:{agent_id}:{session_id}"
+    return f"agent:{path.parent.parent.name}:{_strip_session_suffix(path.name)}"
 
 
 def _file_session_id(path: Path) -> str:
     """Extract just the session UUID from a file path."""
-    name = path.name
-    idx = name.find(".jsonl.reset.")
-    if idx >= 0:
-        return name[:idx]
-    if name.endswith(".jsonl"):
-        return name[:-6]
-    return name
+    return _strip_session_suffix(path.name)
 
 
-def _parse_session_file(path: Path) -> dict | None:
+# Session files above this size are memory-mapped instead of buffered-read.
+_MMAP_THRESHOLD = 1 << 20
+
+
+def _iter_lines(f):
+    """Yield raw lines from an open binary session file.
+
+    Large files are memory-mapped so the OS pages them in lazily and the
+    buffered-reader copy is skipped; small files — the common case — are read
+    in one call and split in a single C pass, which beats the per-line file
+    iterator. Callers already skip the empty trailing element.
+    """
+    if os.fstat(f.fileno()).st_size > _MMAP_THRESHOLD:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter(mm.readline, b"")
+    else:
+        yield from f.read().split(b"\n")
+
+
+def _parse_ts_fast(ts: str) -> datetime | None:
+    """Parse a session timestamp, fast-pathing the YYYY-MM-DDTHH:MM:SS[.ffffff]Z form.
+
+    Slicing out the fields is several times faster than the general-purpose
+    fromisoformat parser and skips the Z-suffix replace() allocation; anything
+    else falls back to fromisoformat. Returns None if the value won't parse.
+    """
+    try:
+        if ts[10] == "T" and ts[-1] == "Z":
+            micro = 0
+            if len(ts) > 20 and ts[19] == ".":
+                micro = int(ts[20:-1][:6].ljust(6, "0"))
+            return datetime(
+                int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+                int(ts[11:13]), int(ts[14:16]), int(ts[17:19]),
+                micro, tzinfo=timezone.utc,
+            )
+    except (ValueError, IndexError):
+        pass
+    try:
+        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _unzip_counts(values: list) -> dict:
+    """Convert a _TOKEN_KEYS-indexed accumulator list back to a sparse dict."""
+    return {k: v for k, v in zip(_TOKEN_KEYS, values) if v}
+
+
+@dataclass(slots=True)
+class ParsedSession:
+    """Aggregated usage for one session file.
+
+    Slotted attribute access is cheaper than dict-key hashing for the
+    downstream aggregation loops, and hundreds of cached sessions take
+    noticeably less memory than 11-key dicts.
+    """
+    key: str
+    session_id: str
+    agent_id: str
+    start_time: datetime | None
+    start_ts: float | None  # epoch seconds, for cheap range/bucket compares
+    model: str
+    messages: int
+    tokens: dict[str, int]
+    cost_by_type: dict[str, float]
+    total_cost: float
+    model_usage: dict[str, dict]
+
+
+def _parse_session_aggregate(path: Path) -> ParsedSession | None:
     """Parse a session JSONL file and return aggregated usage data.
 
-    Returns a dict with: key, session_id, agent_id, start_time, model,
-    messages (count), tokens, cost, model_usage (per-model breakdown),
-    log_entries (list of per-message metadata).
-    Returns None if the file can't be parsed or has no session header.
+    Returns a ParsedSession, or None if the file can't be parsed or has no
+    session header.
+
+    Per-message log entries are deliberately not collected here — only
+    get_session_logs needs them, via _parse_session_logs.
     """
-    tokens: dict[str, int] = {}
-    cost_by_type: dict[str, float] = {}
+    # Accumulators are flat lists indexed by _TOKEN_KEYS position rather than
+    # dicts — one index op instead of a string hash per key per message. They
+    # are converted back to the dict shape once, at return.
+    tokens = [0, 0, 0, 0]
+    cost_by_type = [0.0, 0.0, 0.0, 0.0]
     total_cost = 0.0
     message_count = 0
-    model_usage: dict[str, dict] = {}  # model -> {tokens: {}, cost_by_type: {}, total_cost: float, messages: int}
-    log_entries: list[dict] = []
+    model_usage: dict[str, list] = {}  # model -> [tokens[4], costs[4], total_cost, messages]
     session_id = None
     start_time = None
     current_model = None
     agent_id = path.parent.parent.name
 
     try:
-        with open(path, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
+        with open(path, "rb") as f:
+            for line in _iter_lines(f):
+                if not line.strip():
+                    continue
+                # Cheap substring prefilter (C-level memmem): only the session
+                # header, model changes and assistant messages contribute to
+                # the aggregate, so skip everything else — including user
+                # messages — before paying for a JSON decode.
+                if (b'"session"' not in line
+                        and b'"assistant"' not in line
+                        and b'"model_change"' not in line):
                     continue
                 try:
-                    entry = json.loads(line)
-                except json.JSONDecodeError:
+                    entry = _loads(line)
+                except ValueError:
+                    # Covers json/orjson decode errors and invalid UTF-8
                     continue
 
                 etype = entry.get("type")
@@ -91,67 +249,115 @@ def _parse_session_file(path: Path) -> dict | None:
                     session_id = entry.get("id")
                     ts_str = entry.get("timestamp")
                     if ts_str:
-                        try:
-                            start_time = datetime.fromisoformat(ts_str.replace("Z", "+00:00"))
-                        except ValueError:
-                            pass
+                        start_time = _parse_ts_fast(ts_str)
 
                 elif etype == "model_change":
                     current_model = entry.get("modelId")
 
+                elif etype == "message":
+                    msg = entry.get("message", {})
+                    if msg.get("role") != "assistant":
+                        continue
+                    usage = msg.get("usage", {})
+                    model = msg.get("model") or current_model or "unknown"
+                    msg_cost = usage.get("cost", {})
+                    message_count += 1
+
+                    entry_total_cost = msg_cost.get("total", 0.0)
+                    total_cost += entry_total_cost
+
+                    mu = model_usage.get(model)
+                    if mu is None:
+                        mu = model_usage[model] = [[0, 0, 0, 0], [0.0, 0.0, 0.0, 0.0], 0.0, 0]
+                    mu[2] += entry_total_cost
+                    mu[3] += 1
+                    m_tokens, m_costs = mu[0], mu[1]
+
+                    # One pass per message: fetch each category's token count
+                    # and cost together, updating session-wide and per-model
+                    # accumulators in the same iteration.
+                    for i, key in enumerate(_TOKEN_KEYS):
+                        val = usage.get(key, 0)
+                        if val:
+                            tokens[i] += val
+                            m_tokens[i] += val
+                        val = msg_cost.get(key, 0)
+                        if val:
+                            cost_by_type[i] += val
+                            m_costs[i] += val
+
+    except OSError:
+        return None
+
+    if session_id is None:
+        # Not a valid session file
+        return None
+
+    return ParsedSession(
+        key=f"agent:{agent_id}:{session_id}",
+        session_id=session_id,
+        agent_id=agent_id,
+        start_time=start_time,
+        start_ts=start_time.timestamp() if start_time else None,
+        model=next(iter(model_usage), "unknown"),  # first model used
+        messages=message_count,
+        tokens=_unzip_counts(tokens),
+        cost_by_type=_unzip_counts(cost_by_type),
+        total_cost=total_cost,
+        model_usage={
+            model: {
+                "tokens": _unzip_counts(mu[0]),
+                "cost_by_type": _unzip_counts(mu[1]),
+                "total_cost": mu[2],
+                "messages": mu[3],
+            }
+            for model, mu in model_usage.items()
+        },
+    )
+
+
+def _parse_session_logs(path: Path, limit: int | None = None) -> list[dict] | None:
+    """Parse the last `limit` per-message log entries from a session file.
+
+    Companion to _parse_session_aggregate for get_session_logs: skips all
+    token/cost aggregation and the session header, and keeps only the most
+    recent entries in a ring buffer so a 10k-message session never
+    materializes 10k dicts for a 50-entry response. Returns None only if the
+    file can't be read.
+    """
+    log_entries: deque[dict] = deque(maxlen=limit)
+    current_model = None
+
+    try:
+        with open(path, "rb") as f:
+            for line in _iter_lines(f):
+                if not line.strip():
+                    continue
+                if b'"message"' not in line and b'"model_change"' not in line:
+                    continue
+                try:
+                    entry = _loads(line)
+                except ValueError:
+                    continue
+
+                etype = entry.get("type")
+
+                if etype == "model_change":
+                    current_model = entry.get("modelId")
+
                 elif etype == "message":
                     msg = entry.get("message", {})
                     role = msg.get("role")
                     ts_str = entry.get("timestamp") or msg.get("timestamp")
-                    msg_ts = None
-                    if isinstance(ts_str, str):
-                        try:
-                            msg_ts = datetime.fromisoformat(ts_str.replace("Z", "+00:00"))
-                        except ValueError:
-                            pass
-                    elif isinstance(ts_str, (int, float)):
-                        msg_ts = datetime.fromtimestamp(ts_str / 1000, tz=timezone.utc)
 
                     if role == "assistant":
                         usage = msg.get("usage", {})
                         model = msg.get("model") or current_model or "unknown"
                         msg_cost = usage.get("cost", {})
-                        message_count += 1
-
-                        # Accumulate tokens
-                        for key in ("input", "output", "cacheRead", "cacheWrite"):
-                            val = usage.get(key, 0)
-                            if val:
-                                tokens[key] = tokens.get(key, 0) + val
-
-                        # Accumulate cost
-                        for key in ("input", "output", "cacheRead", "cacheWrite"):
-                            val = msg_cost.get(key, 0)
-                            if val:
-                                cost_by_type[key] = cost_by_type.get(key, 0.0) + val
-                        entry_total_cost = msg_cost.get("total", 0.0)
-                        total_cost += entry_total_cost
-
-                        # Per-model accumulation
-                        if model not in model_usage:
-                            model_usage[model] = {"tokens": {}, "cost_by_type": {}, "total_cost": 0.0, "messages": 0}
-                        mu = model_usage[model]
-                        mu["messages"] += 1
-                        for key in ("input", "output", "cacheRead", "cacheWrite"):
-                            val = usage.get(key, 0)
-                            if val:
-                                mu["tokens"][key] = mu["tokens"].get(key, 0) + val
-                        for key in ("input", "output", "cacheRead", "cacheWrite"):
-                            val = msg_cost.get(key, 0)
-                            if val:
-                                mu["cost_by_type"][key] = mu["cost_by_type"].get(key, 0.0) + val
-                        mu["total_cost"] += entry_total_cost
-
-                        # Log entry for get_session_logs
                         log_entry: dict = {"timestamp": ts_str, "role": role, "model": model}
                         if usage:
                             log_tokens = {}
-                            for key in ("input", "output", "cacheRead", "cacheWrite", "totalTokens"):
+                            for key in _LOG_TOKEN_KEYS:
                                 val = usage.get(key, 0)
                                 if val:
                                     log_tokens[key] = val
@@ -164,64 +370,114 @@ def _parse_session_file(path: Path) -> dict | None:
                     elif role == "user":
                         log_entries.append({"timestamp": ts_str, "role": role})
 
-    except (OSError, UnicodeDecodeError):
+    except OSError:
         return None
 
-    if session_id is None:
-        # Not a valid session file
-        return None
+    return list(log_entries)
 
-    key = f"agent:{agent_id}:{session_id}"
-    return {
-        "key": key,
-        "session_id": session_id,
-        "agent_id": agent_id,
-        "start_time": start_time,
-        "model": next(iter(model_usage), "unknown"),  # first model used
-        "messages": message_count,
-        "tokens": tokens,
-        "cost_by_type": cost_by_type,
-        "total_cost": total_cost,
-        "model_usage": model_usage,
-        "log_entries": log_entries,
-    }
 
+# Memoized parse results: str(path) -> ((st_mtime_ns, st_size) or None, parsed).
+# Archived .jsonl.reset.* files are immutable, so they carry no signature and
+# are never re-read once parsed.
+_PARSE_CACHE: dict[str, tuple[tuple[int, int] | None, ParsedSession | None]] = {}
+
+
+def _parse_session_aggregate_cached(path: Path, stat: os.stat_result | None = None) -> ParsedSession | None:
+    """Parse a session file, reusing the cached result while it is unchanged.
+
+    Accepts an optional stat result so callers that already stat'ed the file
+    (e.g. the mtime prefilter in _scan_sessions) don't trigger a second syscall.
+    """
+    spath = str(path)
+    immutable = ".jsonl.reset." in path.name
+    if immutable:
+        sig = None
+    else:
+        if stat is None:
+            try:
+                stat = path.stat()
+            except OSError:
+                return None
+        sig = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _PARSE_CACHE.get(spath)
+    if cached is not None and (immutable or cached[0] == sig):
+        return cached[1]
+
+    parsed = _parse_session_aggregate(path)
+    _PARSE_CACHE[spath] = (sig, parsed)
+    return parsed
 
-def _scan_sessions(start: date, end: date) -> list[dict]:
+
+# Scan results per (start, end), kept for a few seconds: the typical flow is
+# get_usage followed by list_sessions over the same range moments apart.
+_SCAN_CACHE: dict[tuple[date, date], tuple[float, list[ParsedSession]]] = {}
+_SCAN_TTL = 5.0
+
+
+def _scan_sessions(start: date, end: date) -> list[ParsedSession]:
     """Scan session files and return parsed sessions within the date range."""
+    now = time.monotonic()
+    cached = _SCAN_CACHE.get((start, end))
+    if cached is not None and now - cached[0] < _SCAN_TTL:
+        return cached[1]
+
     agents_dir = AGENTS_DIR
     if not agents_dir.exists():
         return []
 
-    # Convert date range to datetime range (UTC)
-    range_start = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
-    range_end = datetime(end.year, end.month, end.day, 23, 59, 59, tzinfo=timezone.utc)
+    # Convert date range to an epoch-seconds range (UTC)
+    range_start = datetime(start.year, start.month, start.day, tzinfo=timezone.utc).timestamp()
+    range_end = datetime(end.year, end.month, end.day, 23, 59, 59, tzinfo=timezone.utc).timestamp()
 
-    files = _session_files(agents_dir)
-    sessions = []
-
-    for path in files:
-        # Quick pre-filter: skip files last modified before the start of the range
-        try:
-            mtime = datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
-        except OSError:
-            continue
+    # Quick pre-filter: skip files last modified before the start of the range
+    candidates: list[tuple[Path, os.stat_result]] = []
+    for path, st in _session_files(agents_dir):
+        mtime = datetime.fromtimestamp(st.st_mtime, tz=timezone.utc)
         if mtime.date() < start:
             continue
+        # Archived files embed their reset date in the name; a session reset
+        # before the range start must also have started before it, so skip
+        # without opening even when a backup/copy bumped the mtime. There is
+        # no symmetric "after end" skip: an active session that started in
+        # range keeps a fresh mtime for as long as it runs.
+        m = _RESET_DATE_RE.search(path.name)
+        if m:
+            try:
+                if date(int(m[1]), int(m[2]), int(m[3])) < start:
+                    continue
+            except ValueError:
+                pass
+        candidates.append((path, st))
+
+    # Parse candidates in parallel: file reads and orjson decodes both release
+    # the GIL, so a thread pool scales the cold-scan phase across cores. Cache
+    # hits short-circuit inside the workers.
+    if len(candidates) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4)) as ex:
+            parsed_files = list(ex.map(lambda c: _parse_session_aggregate_cached(*c), candidates))
+    else:
+        parsed_files = [_parse_session_aggregate_cached(path, st) for path, st in candidates]
 
-        parsed = _parse_session_file(path)
+    sessions = []
+    for parsed in parsed_files:
         if parsed is None:
             continue
 
         # Filter by session start time
-        st = parsed.get("start_time")
-        if st is None:
+        start_ts = parsed.start_ts
+        if start_ts is None:
             continue
-        if st < range_start or st > range_end:
+        if start_ts < range_start or start_ts > range_end:
             continue
 
         sessions.append(parsed)
 
+    # Purge expired entries so repeated distinct ranges don't accumulate
+    for rng in [r for r, (ts, _) in _SCAN_CACHE.items() if now - ts >= _SCAN_TTL]:
+        del _SCAN_CACHE[rng]
+    _SCAN_CACHE[(start, end)] = (now, sessions)
+
     return sessions
 
 
@@ -257,17 +513,18 @@ def _compute_buckets(start: date, end: date, period: str) -> list[tuple[date, da
     """Return (bucket_start, bucket_end) pairs covering [start, end]."""
     buckets: list[tuple[date, date]] = []
     if period == "day":
-        d = start
-        while d <= end:
+        # range over ordinals: date.fromordinal is a C fast-path and avoids
+        # a timedelta allocation per iteration.
+        for o in range(start.toordinal(), end.toordinal() + 1):
+            d = date.fromordinal(o)
             buckets.append((d, d))
-            d += timedelta(days=1)
     elif period == "week":
-        d = start - timedelta(days=start.weekday())  # Monday of start's week
-        while d <= end:
-            b_start = max(d, start)
-            b_end = min(d + timedelta(days=6), end)
+        end_ord = end.toordinal()
+        monday_ord = start.toordinal() - start.weekday()  # Monday of start's week
+        for o in range(monday_ord, end_ord + 1, 7):
+            b_start = max(date.fromordinal(o), start)
+            b_end = date.fromordinal(min(o + 6, end_ord))
             buckets.append((b_start, b_end))
-            d += timedelta(days=7)
     elif period == "month":
         year, month = start.year, start.month
         while True:
@@ -287,10 +544,20 @@ def _compute_buckets(start: date, end: date, period: str) -> list[tuple[date, da
 
 
 def _period_label(b_start: date, b_end: date, period: str) -> str:
+    return _period_label_cached(b_start.toordinal(), b_end.toordinal(), period)
+
+
+@lru_cache(maxsize=1024)
+def _period_label_cached(b_start_ord: int, b_end_ord: int, period: str) -> str:
+    # Day numbers are formatted via attribute access rather than %-d, which
+    # is a glibc extension that fails on Windows strftime.
+    b_start = date.fromordinal(b_start_ord)
+    b_end = date.fromordinal(b_end_ord)
     if period == "day":
-        return b_start.strftime("%A, %b %-d %Y")
+        return f"{b_start.strftime('%A, %b')} {b_start.day} {b_start.year}"
     elif period == "week":
-        return f"Week of {b_start.strftime('%b %-d %Y')} – {b_end.strftime('%b %-d %Y')}"
+        return (f"Week of {b_start.strftime('%b')} {b_start.day} {b_start.year}"
+                f" – {b_end.strftime('%b')} {b_end.day} {b_end.year}")
     elif period == "month":
         return b_start.strftime("%B %Y")
     return f"{b_start} – {b_end}"
@@ -300,14 +567,42 @@ def _period_label(b_start: date, b_end: date, period: str) -> str:
 # Aggregation helpers
 # ---------------------------------------------------------------------------
 
-def _build_session_entry(session: dict) -> dict:
-    """Build a compact session summary from a parsed session dict."""
-    tokens = session["tokens"]
-    cost_by_type = session["cost_by_type"]
-    total_cost = session["total_cost"]
+def _bucket_sessions(sessions: list[ParsedSession],
+                     buckets: list[tuple[date, date]]) -> list[list[ParsedSession]]:
+    """Assign each session to its period bucket in a single O(N log B) pass.
+
+    Buckets from _compute_buckets are sorted and contiguous, so the owning
+    bucket is found by bisecting on bucket start; a session past its bucket's
+    end (only possible at the range edge) is dropped, matching the old
+    per-bucket range filter.
+    """
+    bucket_starts = [
+        datetime(bs.year, bs.month, bs.day, tzinfo=timezone.utc).timestamp()
+        for bs, _ in buckets
+    ]
+    bucket_ends = [
+        datetime(be.year, be.month, be.day, 23, 59, 59, tzinfo=timezone.utc).timestamp()
+        for _, be in buckets
+    ]
+    per_bucket: list[list[ParsedSession]] = [[] for _ in buckets]
+    for s in sessions:
+        start_ts = s.start_ts
+        if not start_ts:
+            continue
+        i = bisect.bisect_right(bucket_starts, start_ts) - 1
+        if i >= 0 and start_ts <= bucket_ends[i]:
+            per_bucket[i].append(s)
+    return per_bucket
+
+
+def _build_session_entry(session: ParsedSession) -> dict:
+    """Build a compact session summary from a parsed session."""
+    tokens = session.tokens
+    cost_by_type = session.cost_by_type
+    total_cost = session.total_cost
 
     models_out = []
-    for model, mu in session["model_usage"].items():
+    for model, mu in session.model_usage.items():
         m_tokens = mu["tokens"]
         m_cost_by_type = mu["cost_by_type"]
         m_cost = mu["total_cost"]
@@ -315,46 +610,41 @@ def _build_session_entry(session: dict) -> dict:
             models_out.append({
                 "model": model,
                 "tokens": m_tokens,
-                "cost": {**{k: round(v, 6) for k, v in m_cost_by_type.items()},
-                         "total": round(m_cost, 6)},
+                "cost": {**m_cost_by_type, "total": m_cost},
             })
 
     entry: dict = {
-        "key": session["key"],
-        "model": session["model"],
+        "key": session.key,
+        "model": session.model,
         "channel": "",
     }
-    if session["messages"]:
-        entry["messages"] = session["messages"]
+    if session.messages:
+        entry["messages"] = session.messages
     entry["tokens"] = tokens
-    entry["cost"] = {**{k: round(v, 6) for k, v in cost_by_type.items()},
-                     "total": round(total_cost, 6)}
+    entry["cost"] = {**cost_by_type, "total": total_cost}
     if len(models_out) > 1:
         entry["by_model"] = models_out
     return entry
 
 
-def _aggregate_sessions(sessions: list[dict]) -> dict:
-    """Aggregate a list of session entries into a single 'other' summary."""
-    agg_tokens: dict[str, int] = {}
-    agg_cost_by_type: dict[str, float] = {}
+def _aggregate_sessions(sessions: list[ParsedSession]) -> dict:
+    """Aggregate parsed sessions into a single 'other' summary entry."""
+    agg_tokens: dict[str, int] = defaultdict(int)
+    agg_cost_by_type: dict[str, float] = defaultdict(float)
     agg_cost = 0.0
     agg_messages = 0
     for s in sessions:
-        for k, v in s.get("tokens", {}).items():
-            agg_tokens[k] = agg_tokens.get(k, 0) + v
-        cost = s.get("cost", {})
-        for k in ("input", "output", "cacheRead", "cacheWrite"):
-            if k in cost:
-                agg_cost_by_type[k] = agg_cost_by_type.get(k, 0.0) + cost[k]
-        agg_cost += cost.get("total", 0.0)
-        agg_messages += s.get("messages", 0)
+        for k, v in s.tokens.items():
+            agg_tokens[k] += v
+        for k, v in s.cost_by_type.items():
+            agg_cost_by_type[k] += v
+        agg_cost += s.total_cost
+        agg_messages += s.messages
     entry: dict = {"key": "(other)", "sessions": len(sessions)}
     if agg_messages:
         entry["messages"] = agg_messages
     entry["tokens"] = agg_tokens
-    entry["cost"] = {**{k: round(v, 6) for k, v in agg_cost_by_type.items()},
-                     "total": round(agg_cost, 6)}
+    entry["cost"] = {**agg_cost_by_type, "total": agg_cost}
     return entry
 
 
@@ -387,64 +677,50 @@ async def get_usage(
 
     buckets = _compute_buckets(start, end, period)
     all_sessions = _scan_sessions(start, end)
+    per_bucket = _bucket_sessions(all_sessions, buckets)
 
-    result_periods = []
-    for b_start, b_end in buckets:
-        range_start = datetime(b_start.year, b_start.month, b_start.day, tzinfo=timezone.utc)
-        range_end = datetime(b_end.year, b_end.month, b_end.day, 23, 59, 59, tzinfo=timezone.utc)
-
-        # Filter sessions for this bucket
-        bucket_sessions = [
-            s for s in all_sessions
-            if s["start_time"] and range_start <= s["start_time"] <= range_end
-        ]
+    result_periods: list[dict | None] = [None] * len(buckets)
+    for i, (b_start, b_end) in enumerate(buckets):
+        bucket_sessions = per_bucket[i]
 
-        # Aggregate by model across all sessions in this bucket
-        by_model: dict[str, dict] = {}
+        # Aggregate by model across all sessions in this bucket, into flat
+        # _bucket_row lists (fixed indices, one hash per model per session).
+        by_model: dict[str, list] = defaultdict(_bucket_row)
         for s in bucket_sessions:
-            for model, mu in s["model_usage"].items():
-                if model not in by_model:
-                    by_model[model] = {"tokens": {}, "cost_by_type": {}, "total_cost": 0.0}
-                bm = by_model[model]
+            for model, mu in s.model_usage.items():
+                row = by_model[model]
                 for k, v in mu["tokens"].items():
-                    bm["tokens"][k] = bm["tokens"].get(k, 0) + v
+                    row[_TOKEN_IDX[k]] += v
                 for k, v in mu["cost_by_type"].items():
-                    bm["cost_by_type"][k] = bm["cost_by_type"].get(k, 0.0) + v
-                bm["total_cost"] += mu["total_cost"]
+                    row[4 + _TOKEN_IDX[k]] += v
+                row[8] += mu["total_cost"]
 
-        totals_tokens: dict[str, int] = {}
-        totals_cost_by_type: dict[str, float] = {}
-        totals_cost = 0.0
+        totals = _bucket_row()
         models_out = []
 
-        for model, bm in by_model.items():
-            tokens = bm["tokens"]
-            cost_by_type = bm["cost_by_type"]
-            cost = bm["total_cost"]
-            totals_cost += cost
-            for k, v in tokens.items():
-                totals_tokens[k] = totals_tokens.get(k, 0) + v
-            for k, v in cost_by_type.items():
-                totals_cost_by_type[k] = totals_cost_by_type.get(k, 0.0) + v
+        for model, row in by_model.items():
+            for j in range(9):
+                totals[j] += row[j]
+            tokens = _unzip_counts(row[:4])
+            cost_by_type = _unzip_counts(row[4:8])
+            cost = row[8]
             if tokens or cost:
                 models_out.append({
                     "model": model,
                     "tokens": tokens,
-                    "cost": {**{k: round(v, 6) for k, v in cost_by_type.items()},
-                             "total": round(cost, 6)},
+                    "cost": {**cost_by_type, "total": cost},
                 })
 
-        result_periods.append({
+        result_periods[i] = {
             "period": _period_label(b_start, b_end, period),
             "totals": {
-                "tokens": totals_tokens,
-                "cost": {**{k: round(v, 6) for k, v in totals_cost_by_type.items()},
-                         "total": round(totals_cost, 6)},
+                "tokens": _unzip_counts(totals[:4]),
+                "cost": {**_unzip_counts(totals[4:8]), "total": totals[8]},
             },
             "by_model": models_out,
-        })
+        }
 
-    return json.dumps(result_periods, indent=2)
+    return _dumps(result_periods, round_floats=True)
 
 
 @mcp.tool()
@@ -477,37 +753,33 @@ async def list_sessions(
 
     buckets = _compute_buckets(start, end, period)
     scanned = _scan_sessions(start, end)
+    per_bucket = _bucket_sessions(scanned, buckets)
 
-    result_periods = []
-    for b_start, b_end in buckets:
-        range_start = datetime(b_start.year, b_start.month, b_start.day, tzinfo=timezone.utc)
-        range_end = datetime(b_end.year, b_end.month, b_end.day, 23, 59, 59, tzinfo=timezone.utc)
+    result_periods: list[dict | None] = [None] * len(buckets)
+    for i, (b_start, b_end) in enumerate(buckets):
+        bucket_sessions = per_bucket[i]
 
-        bucket_sessions = [
-            s for s in scanned
-            if s["start_time"] and range_start <= s["start_time"] <= range_end
-        ]
-
-        entries = [_build_session_entry(s) for s in bucket_sessions]
         # Drop zero-usage sessions
-        entries = [e for e in entries if e.get("cost", {}).get("total", 0)]
+        active = [s for s in bucket_sessions if s.total_cost]
 
         if all_sessions:
-            sessions_out = entries
+            sessions_out = [_build_session_entry(s) for s in active]
         else:
-            entries.sort(key=lambda e: e.get("cost", {}).get("total", 0), reverse=True)
-            top = entries[:top_n]
-            rest = entries[top_n:]
-            sessions_out = top
+            # Pick survivors on the parsed sessions so only the top N ever
+            # get a formatted entry; the rest feed straight into the rollup.
+            top = heapq.nlargest(top_n, active, key=lambda s: s.total_cost)
+            top_ids = {id(s) for s in top}
+            rest = [s for s in active if id(s) not in top_ids]
+            sessions_out = [_build_session_entry(s) for s in top]
             if rest:
                 sessions_out.append(_aggregate_sessions(rest))
 
-        result_periods.append({
+        result_periods[i] = {
             "period": _period_label(b_start, b_end, period),
             "sessions": sessions_out,
-        })
+        }
 
-    return json.dumps(result_periods, indent=2)
+    return _dumps(result_periods, round_floats=True)
 
 
 @mcp.tool()
@@ -525,17 +797,17 @@ async def get_session_logs(key: str, limit: int = 50) -> str:
     if path is None:
         return json.dumps({"error": f"Session not found: {key}"})
 
-    parsed = _parse_session_file(path)
-    if parsed is None:
+    entries = _parse_session_logs(path, limit)
+    if entries is None:
         return json.dumps({"error": f"Could not parse session file for: {key}"})
 
-    entries = parsed["log_entries"]
-    # Return most recent `limit` entries
-    if len(entries) > limit:
-        entries = entries[-limit:]
-
-    return json.dumps(entries, indent=2)
+    return _dumps(entries)
 
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     mcp.run(transport="stdio")